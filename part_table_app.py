@@ -3,8 +3,10 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import hashlib
-import io
+import hmac
+from collections import deque
 import math
+import numpy as np
 
 # ----------------------------
 # App config
@@ -14,20 +16,22 @@ st.set_page_config(page_title="Multi-Rack FG Stock Board", layout="wide")
 # ----------------------------
 # Demo authenticator (IN-APP demo only)
 # ----------------------------
-USERS = {
-    "Vishal": {"pw_hash": hashlib.sha256(b"master123").hexdigest(), "role": "master"},
-    "Kittu": {"pw_hash": hashlib.sha256(b"input123").hexdigest(), "role": "input"},
-    "1306764": {"pw_hash": hashlib.sha256(b"output123").hexdigest(), "role": "output"},
+_RAW_USERS = {
+    "Vishal": (b"master123", "master"),
+    "Kittu": (b"input123", "input"),
+    "1306764": (b"output123", "output"),
 }
 
-def hash_pw(pw: str) -> str:
-    return hashlib.sha256(pw.encode("utf-8")).hexdigest()
+_USERS = {u: (hashlib.sha256(pw).digest(), role) for u, (pw, role) in _RAW_USERS.items()}
+
+def hash_pw(pw: str) -> bytes:
+    return hashlib.sha256(pw.encode("utf-8")).digest()
 
 def login(username: str, password: str):
-    u = USERS.get(username)
-    if not u:
+    digest, role = _USERS.get(username, (None, None))
+    if digest is None:
         return False, None
-    return (u["pw_hash"] == hash_pw(password)), u["role"]
+    return hmac.compare_digest(digest, hash_pw(password)), role
 
 # ----------------------------
 # Constants
@@ -36,6 +40,10 @@ PACKAGING_WEIGHT = 25.0  # kg per non-empty cell
 CELL_CAPACITY = 25       # pieces per cell
 RACK_SPACES = {"A": 9, "B": 15, "C": 12, "D": 6, "E": 24, "F": 57}
 FIXED_ROWS = 3
+HISTORY_PAGE_SIZE = 50  # rows sent to the browser per History Log page
+HISTORY_COLS = ["Timestamp", "User", "Action", "Rack", "Row", "Col", "Part No", "Quantity", "Note"]
+# Stored history entries keep the palette index; "Part No" is projected on render
+HISTORY_FIELDS = [c if c != "Part No" else "Part Idx" for c in HISTORY_COLS]
 
 # ----------------------------
 # Init session state
@@ -51,17 +59,38 @@ if "part_master" not in st.session_state:
         "10291078": {"Weight": 7.90, "Customer": "Mahindra Pune", "Tube Length": 1245},
         "10282069": {"Weight": 8.95, "Customer": "Mahindra Pune", "Tube Length": 1262},
     }
+    st.session_state.part_master_rev = 0
+
+def refresh_weights_lut():
+    pm = st.session_state.part_master
+    st.session_state.weights_lut = np.array(
+        [pm.get(pn, {}).get("Weight", 0.0) for pn in st.session_state.part_palette], dtype=np.float64
+    )
+
+# Part numbers are interned into a palette; racks store palette indices (-1 = empty)
+if "part_palette" not in st.session_state:
+    st.session_state.part_palette = list(st.session_state.part_master.keys())
+    st.session_state.part_to_idx = {pn: i for i, pn in enumerate(st.session_state.part_palette)}
+    refresh_weights_lut()
 
 if "racks" not in st.session_state:
     racks = {}
     for r, spaces in RACK_SPACES.items():
         cols = math.ceil(spaces / FIXED_ROWS)
-        grid = [[{"Part No": None, "Quantity": 0} for _ in range(cols)] for _ in range(FIXED_ROWS)]
-        racks[r] = {"rows": FIXED_ROWS, "cols": cols, "array": grid, "spaces": spaces}
+        racks[r] = {
+            "rows": FIXED_ROWS,
+            "cols": cols,
+            "spaces": spaces,
+            "qty": np.zeros((FIXED_ROWS, cols), dtype=np.int32),
+            "part_idx": np.full((FIXED_ROWS, cols), -1, dtype=np.int16),
+        }
     st.session_state.racks = racks
+    st.session_state.racks_rev = 0
+    st.session_state.total_qty = 0  # running sum, kept in step by the Input tab
 
 if "history" not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = deque()  # unbounded: FIFO lookup relies on every Add event
+    st.session_state.history_rev = 0
 
 # ----------------------------
 # Utilities
@@ -69,24 +98,28 @@ if "history" not in st.session_state:
 def ts_now():
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def cell_total_weight(cell):
-    pn, qty = cell["Part No"], cell["Quantity"]
-    if qty > 0 and pn:
-        pm = st.session_state.part_master.get(pn, {})
-        return qty * pm.get("Weight", 0.0) + PACKAGING_WEIGHT
-    return 0.0
-
-def total_weight_all():
-    return sum(
-        cell_total_weight(c)
-        for rack in st.session_state.racks.values()
-        for row in rack["array"]
-        for c in row
-    )
+def memo_by_rev(key, rev, build):
+    # Per-session memo: rebuild only when the owning revision counter moves
+    cached = st.session_state.get(key)
+    if cached is None or cached[0] != rev:
+        cached = (rev, build())
+        st.session_state[key] = cached
+    return cached[1]
+
+def part_index(pn):
+    idx = st.session_state.part_to_idx.get(pn)
+    if idx is None:
+        idx = len(st.session_state.part_palette)
+        st.session_state.part_palette.append(pn)
+        st.session_state.part_to_idx[pn] = idx
+    return idx
+
+def rack_weights(rack):
+    qty = rack["qty"]
+    return np.where(qty > 0, qty * st.session_state.weights_lut[rack["part_idx"]] + PACKAGING_WEIGHT, 0.0)
 
 def add_history(action, rack, row_ui, col_ui, part_no, qty, user, note=""):
-    st.session_state.history.insert(
-        0,
+    st.session_state.history.appendleft(
         {
             "Timestamp": ts_now(),
             "User": user,
@@ -94,47 +127,100 @@ def add_history(action, rack, row_ui, col_ui, part_no, qty, user, note=""):
             "Rack": rack,
             "Row": row_ui,
             "Col": col_ui,
-            "Part No": part_no,
+            "Part Idx": part_index(part_no),
             "Quantity": qty,
             "Note": note,
         },
     )
+    st.session_state.history_rev += 1
+
+def get_history_df():
+    return memo_by_rev(
+        "_history_df",
+        st.session_state.history_rev,
+        lambda: pd.DataFrame(list(st.session_state.history), columns=HISTORY_FIELDS),
+    )
+
+def with_part_no(df):
+    # Project palette indices to part numbers for just the rows passed in
+    palette = np.array(st.session_state.part_palette, dtype=object)
+    part_nos = palette[df["Part Idx"].to_numpy(dtype=np.int64)]
+    return df.assign(**{"Part Idx": part_nos}).rename(columns={"Part Idx": "Part No"})
 
 def prepare_rack_grid_csv():
-    rows = []
+    pm = st.session_state.part_master
+    palette = st.session_state.part_palette
+    # One extra trailing slot so part_idx == -1 (empty cell) lands on the blank values
+    parts = np.array(palette + [None], dtype=object)
+    customers = np.array([pm.get(pn, {}).get("Customer", "") for pn in palette] + [""], dtype=object)
+    tubes = np.array([pm.get(pn, {}).get("Tube Length", "") for pn in palette] + [""], dtype=object)
+
+    cols = {k: [] for k in ("Rack", "Row", "Col", "Part Idx", "Quantity", "Total Weight (kg)")}
     for rn, rack in st.session_state.racks.items():
-        for i in range(rack["rows"]):
-            for j in range(rack["cols"]):
-                c = rack["array"][i][j]
-                pm = st.session_state.part_master.get(c["Part No"], {}) if c["Part No"] else {}
-                rows.append(
-                    {
-                        "Rack": rn,
-                        "Row": i + 1,
-                        "Col": j + 1,
-                        "Part No": c["Part No"],
-                        "Customer": pm.get("Customer", ""),
-                        "Tube Length (mm)": pm.get("Tube Length", ""),
-                        "Quantity": c["Quantity"],
-                        "Total Weight (kg)": round(cell_total_weight(c), 2),
-                    }
-                )
-    return pd.DataFrame(rows)
+        ii, jj = np.indices((rack["rows"], rack["cols"]), dtype=np.int16)
+        cols["Rack"].append(np.full(ii.size, rn, dtype=object))
+        cols["Row"].append(ii.ravel() + 1)
+        cols["Col"].append(jj.ravel() + 1)
+        cols["Part Idx"].append(rack["part_idx"].ravel())
+        cols["Quantity"].append(rack["qty"].ravel())
+        cols["Total Weight (kg)"].append(rack_weights(rack).ravel().round(2))
+    cols = {k: np.concatenate(v) for k, v in cols.items()}
+
+    pidx = cols.pop("Part Idx")
+    return pd.DataFrame(
+        {
+            "Rack": pd.Categorical(cols["Rack"], categories=list(st.session_state.racks)),
+            "Row": cols["Row"],
+            "Col": cols["Col"],
+            "Part No": parts[pidx],
+            "Customer": customers[pidx],
+            "Tube Length (mm)": tubes[pidx],
+            "Quantity": cols["Quantity"],
+            "Total Weight (kg)": cols["Total Weight (kg)"],
+        }
+    )
+
+def get_rack_grid_df():
+    return memo_by_rev("_rack_grid_df", st.session_state.racks_rev, prepare_rack_grid_csv)
+
+def prepare_rack_grid_csv_bytes():
+    return memo_by_rev(
+        "_rack_grid_csv",
+        st.session_state.racks_rev,
+        lambda: get_rack_grid_df().to_csv(index=False).encode("utf-8"),
+    )
+
+def get_part_options():
+    return memo_by_rev(
+        "_part_options",
+        st.session_state.part_master_rev,
+        lambda: tuple(sorted(st.session_state.part_master.keys())),
+    )
+
+def get_part_master_df():
+    return memo_by_rev(
+        "_part_master_df",
+        st.session_state.part_master_rev,
+        lambda: pd.DataFrame.from_dict(st.session_state.part_master, orient="index")
+        .reset_index()
+        .rename(columns={"index": "Part No"}),
+    )
 
 def prepare_part_master_csv_bytes():
-    df = pd.DataFrame.from_dict(st.session_state.part_master, orient="index").reset_index()
-    df = df.rename(columns={"index": "Part No"})
-    buf = io.StringIO()
-    df.to_csv(buf, index=False)
-    return buf.getvalue().encode("utf-8")
+    return memo_by_rev(
+        "_part_master_csv",
+        st.session_state.part_master_rev,
+        lambda: get_part_master_df().to_csv(index=False).encode("utf-8"),
+    )
 
 def prepare_history_csv_bytes():
     if not st.session_state.history:
         return "".encode("utf-8")
-    df = pd.DataFrame(st.session_state.history)
-    buf = io.StringIO()
-    df.to_csv(buf, index=False)
-    return buf.getvalue().encode("utf-8")
+    return memo_by_rev(
+        "_history_csv",
+        st.session_state.history_rev,
+        lambda: with_part_no(get_history_df()).to_csv(index=False).encode("utf-8"),
+    )
 
 # ----------------------------
 # Authentication UI
@@ -184,9 +270,7 @@ with col1:
     st.title("Multi-Rack FG Stock Board")
     st.caption(f"Signed in as {st.session_state.user} ({role})")
 with col2:
-    
-    total_qty = sum(c["Quantity"] for r in st.session_state.racks.values() for row in r["array"] for c in row)
-    st.metric("Total Qty", f"{total_qty}")
+    st.metric("Total Qty", f"{st.session_state.total_qty}")
 
 # ----------------------------
 # Tabs
@@ -209,9 +293,13 @@ if can_master:
             if st.form_submit_button("Add / Update Part"):
                 if pn:
                     st.session_state.part_master[pn] = {"Weight": wt, "Customer": cust, "Tube Length": int(tube)}
+                    part_index(pn)
+                    refresh_weights_lut()
+                    st.session_state.part_master_rev += 1
+                    st.session_state.racks_rev += 1  # grid shows master data
                     add_history("Master Update", "-", "-", "-", pn, 0, st.session_state.user)
                     st.success(f"Updated master for {pn}")
-        st.dataframe(pd.DataFrame.from_dict(st.session_state.part_master, orient="index").reset_index().rename(columns={"index":"Part No"}))
+        st.dataframe(get_part_master_df())
         st.download_button("⬇️ Download Part Master CSV", data=prepare_part_master_csv_bytes(), file_name="part_master.csv", mime="text/csv")
 
 # INPUT Tab
@@ -225,16 +313,20 @@ if can_input:
         with st.form("stock_form", clear_on_submit=True):
             row_ui = st.number_input("Row (bottom=1)", min_value=1, max_value=ROWS, value=1, step=1)
             col_ui = st.number_input("Column", min_value=1, max_value=COLS, value=1, step=1)
-            part_no = st.selectbox("Part No", options=sorted(st.session_state.part_master.keys()))
+            part_no = st.selectbox("Part No", options=get_part_options())
             qty = st.number_input("Quantity", min_value=1, step=1)
             action = st.radio("Action", ["Add", "Subtract"], horizontal=True)
             if st.form_submit_button("Apply"):
-                cell = rack_data["array"][row_ui - 1][col_ui - 1]
+                i, j = row_ui - 1, col_ui - 1
+                pidx = part_index(part_no)
+                cell_idx, cell_qty = int(rack_data["part_idx"][i, j]), int(rack_data["qty"][i, j])
                 if action == "Add":
-                    if cell["Part No"] in (None, part_no):
-                        if cell["Quantity"] + qty <= CELL_CAPACITY:
-                            cell["Part No"] = part_no
-                            cell["Quantity"] += qty
+                    if cell_idx in (-1, pidx):
+                        if cell_qty + qty <= CELL_CAPACITY:
+                            rack_data["part_idx"][i, j] = pidx
+                            rack_data["qty"][i, j] += qty
+                            st.session_state.total_qty += qty
+                            st.session_state.racks_rev += 1
                             add_history("Add", rack_ui, row_ui, col_ui, part_no, qty, st.session_state.user)
                             st.success(f"Added {qty} of {part_no} at {rack_ui} R{row_ui} C{col_ui}")
                         else:
@@ -242,42 +334,66 @@ if can_input:
                     else:
                         st.error("Cell already has a different part")
                 else:  # Subtract
-                    if cell["Part No"] == part_no and cell["Quantity"] >= qty:
-                        cell["Quantity"] -= qty
-                        if cell["Quantity"] == 0: cell["Part No"] = None
+                    if cell_idx == pidx and cell_qty >= qty:
+                        rack_data["qty"][i, j] -= qty
+                        st.session_state.total_qty -= qty
+                        if rack_data["qty"][i, j] == 0: rack_data["part_idx"][i, j] = -1
+                        st.session_state.racks_rev += 1
                         add_history("Subtract", rack_ui, row_ui, col_ui, part_no, qty, st.session_state.user)
                         st.success(f"Subtracted {qty} from {rack_ui} R{row_ui} C{col_ui}")
                     else:
                         st.error("Mismatch or insufficient stock")
 
-        st.download_button("⬇️ Download Grid CSV", data=prepare_rack_grid_csv().to_csv(index=False).encode("utf-8"), file_name="grid.csv", mime="text/csv")
+        st.download_button("⬇️ Download Grid CSV", data=prepare_rack_grid_csv_bytes(), file_name="grid.csv", mime="text/csv")
 
 # OUTPUT Tab
+# Read-only sections run as fragments so their widgets rerun only themselves
+@st.fragment
+def rack_overview():
+    st.subheader("Rack Overview")
+    out_rack = st.selectbox("Select Rack to View", options=list(st.session_state.racks.keys()))
+    grid_df = get_rack_grid_df()
+    st.dataframe(grid_df[grid_df["Rack"] == out_rack])
+
+@st.fragment
+def fifo_finder():
+    st.subheader("FIFO Part Finder")
+    search_part = st.text_input("Part No")
+    if st.button("Find FIFO Cell"):
+        fifo, fifo_qty = None, 0
+        pidx = st.session_state.part_to_idx.get(search_part, -1)
+        hdf = get_history_df()
+        mask = (hdf["Action"]=="Add") & (hdf["Part Idx"]==pidx)
+        # History is newest-first; walk matching adds oldest-first
+        for rk,row_ui,col_ui in hdf.loc[mask, ["Rack","Row","Col"]].iloc[::-1].itertuples(index=False, name=None):
+            rack = st.session_state.racks[rk]
+            i, j = int(row_ui)-1, int(col_ui)-1
+            if rack["part_idx"][i, j]==pidx and rack["qty"][i, j]>0:
+                fifo, fifo_qty = {"Rack": rk, "Row": i+1, "Col": j+1}, int(rack["qty"][i, j])
+                break
+        if fifo:
+            st.success(f"FIFO pick: Rack {fifo['Rack']} R{fifo['Row']} C{fifo['Col']} (Qty: {fifo_qty})")
+        else:
+            st.warning("No FIFO candidate found")
+
+@st.fragment
+def history_log():
+    st.subheader("History Log")
+    if st.session_state.history:
+        hist_df = get_history_df()
+        pages = max(1, math.ceil(len(hist_df) / HISTORY_PAGE_SIZE))
+        # Keyed and without max_value so the widget keeps its page as the log grows
+        if st.session_state.get("history_page", 1) > pages:
+            st.session_state.history_page = pages
+        page = min(st.number_input("History page", min_value=1, step=1, key="history_page"), pages)
+        st.dataframe(with_part_no(hist_df.iloc[(page - 1) * HISTORY_PAGE_SIZE : page * HISTORY_PAGE_SIZE]))
+        st.caption(f"Page {page} of {pages} ({len(hist_df)} entries, newest first)")
+        st.download_button("⬇️ Download History CSV", data=prepare_history_csv_bytes(), file_name="history.csv", mime="text/csv")
+    else:
+        st.info("No history yet")
+
 if can_output:
     with tab_objs[tabs.index("Output")]:
-        st.subheader("Rack Overview")
-        out_rack = st.selectbox("Select Rack to View", options=list(st.session_state.racks.keys()))
-        st.dataframe(prepare_rack_grid_csv().query("Rack == @out_rack"))
-
-        st.subheader("FIFO Part Finder")
-        search_part = st.text_input("Part No")
-        if st.button("Find FIFO Cell"):
-            fifo = None
-            for ev in reversed(st.session_state.history):
-                if ev["Action"]=="Add" and ev["Part No"]==search_part:
-                    rk,row_ui,col_ui = ev["Rack"], ev["Row"], ev["Col"]
-                    cell = st.session_state.racks[rk]["array"][row_ui-1][col_ui-1]
-                    if cell["Part No"]==search_part and cell["Quantity"]>0:
-                        fifo = ev
-                        break
-            if fifo:
-                st.success(f"FIFO pick: Rack {fifo['Rack']} R{fifo['Row']} C{fifo['Col']} (Qty: {cell['Quantity']})")
-            else:
-                st.warning("No FIFO candidate found")
-
-        st.subheader("History Log")
-        if st.session_state.history:
-            st.dataframe(pd.DataFrame(st.session_state.history))
-            st.download_button("⬇️ Download History CSV", data=prepare_history_csv_bytes(), file_name="history.csv", mime="text/csv")
-        else:
-            st.info("No history yet")
+        rack_overview()
+        fifo_finder()
+        history_log()